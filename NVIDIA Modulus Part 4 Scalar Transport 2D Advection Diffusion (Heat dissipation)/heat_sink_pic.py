@@ -16,6 +16,7 @@
 
 import os
 import warnings
+from functools import lru_cache
 
 import torch
 import numpy as np
@@ -43,13 +44,27 @@ from modulus.sym.key import Key
 from modulus.sym.node import Node
 from modulus.sym.geometry import Parameterization, Parameter
 
-import scipy.interpolate
+import scipy.spatial
 import matplotlib.pyplot as plt
 from modulus.sym.utils.io.plotter import ValidatorPlotter, InferencerPlotter
 
 # Define custom class
 class CustomValidatorPlotter(ValidatorPlotter):
 
+    # Interpolation grid (nx, ny): square cells over the 5 x 1 channel (imshow keeps
+    # equal aspect), ~0.025 spacing resolves each 0.1 thick fin with 4 cells
+    GRID_RES = (200, 40)
+
+    def __init__(self, grid_res=GRID_RES, device=None, show_colorbar=True):
+        super().__init__()
+        self.grid_res = grid_res
+        self.device = device  # e.g. "cuda" to interpolate on the GPU
+        self.show_colorbar = show_colorbar  # read on every call, may be toggled
+        # Figure, axes, images and colorbars are created on the first call and reused
+        self._fig, self._axes, self._images, self._colorbars = None, None, None, None
+        # Triangulation of the last validator point cloud and its query weights
+        self._tri_cache = None
+
     def __call__(self, invar, true_outvar, pred_outvar):
         "Custom plotting function for validator"
 
@@ -57,28 +72,38 @@ class CustomValidatorPlotter(ValidatorPlotter):
         x, y = invar["x"][:, 0], invar["y"][:, 0]
         extent = (x.min(), x.max(), y.min(), y.max())
 
-        # Extract p, u, v, nu, c from true and predicted outputs
-        p_true, u_true, v_true, nu_true, c_true = (
-            true_outvar["p"][:, 0],
-            true_outvar["u"][:, 0],
-            true_outvar["v"][:, 0],
-            true_outvar["nu"][:, 0],
-            true_outvar["c"][:, 0]*273.15,
-        )
-        p_pred, u_pred, v_pred, nu_pred, c_pred = (
-            pred_outvar["p"][:, 0],
-            pred_outvar["u"][:, 0],
-            pred_outvar["v"][:, 0],
-            pred_outvar["nu"][:, 0],
-            pred_outvar["c"][:, 0]*273.15,
+        # Validator points do not change between calls, reuse their triangulation
+        # and the simplex lookup / weights of the query grid
+        cache = self._tri_cache
+        if cache is None or not (
+            np.array_equal(cache["x"], x) and np.array_equal(cache["y"], y)
+        ):
+            tri = scipy.spatial.Delaunay(np.column_stack([x, y]))
+            cache = self._tri_cache = {"x": x.copy(), "y": y.copy(), "tri": tri, "bary": {}}
+        grid_key = (
+            tuple(round(float(e), 6) for e in extent), tuple(self.grid_res), self.device
         )
+        if grid_key not in cache["bary"]:
+            bary = self._bary_weights(cache["tri"], extent, self.grid_res)
+            if self.device is not None:
+                bary = self._bary_to_device(bary, self.device)
+            cache["bary"][grid_key] = bary
+
+        # Flatten p, u, v, nu, c from true and predicted outputs once
+        fields = ("p", "u", "v", "nu", "c")
+        true = {k: np.asarray(true_outvar[k]).reshape(-1) for k in fields}
+        pred = {k: np.asarray(pred_outvar[k]).reshape(-1) for k in fields}
+        # Scale c without writing into the validator's arrays
+        true["c"] = true["c"] * 273.15
+        pred["c"] = pred["c"] * 273.15
 
         # Interpolate all variables
         (
             p_true, u_true, v_true, nu_true, c_true,
             p_pred, u_pred, v_pred, nu_pred, c_pred
-        ) = CustomValidatorPlotter.interpolate_output(
-            x, y, [p_true, u_true, v_true, nu_true, c_true, p_pred, u_pred, v_pred, nu_pred, c_pred], extent
+        ) = self.interpolate_output(
+            x, y, [true[k] for k in fields] + [pred[k] for k in fields], extent,
+            self.grid_res, self.device, bary=cache["bary"][grid_key],
         )
 
         # Compute differences
@@ -97,9 +122,26 @@ class CustomValidatorPlotter(ValidatorPlotter):
             "c": (0, 55),  
         }
 
-        # Create plot (5 rows, 3 columns) with updated size
-        f, axes = plt.subplots(5, 3, figsize=(20, 10), dpi=100)
-        plt.suptitle("Heat sink 2D: PINN vs True Solution")
+        # Create plot (5 rows, 3 columns) with updated size once, then reuse it
+        if self._fig is None:
+            self._fig, self._axes = plt.subplots(
+                5, 3, figsize=(20, 10), dpi=100, constrained_layout=True
+            )
+            self._fig.suptitle("Heat sink 2D: PINN vs True Solution")
+            self._images = [None] * self._axes.size
+            self._colorbars = [None] * self._axes.size
+        f, axes = self._fig, self._axes
+
+        # show_colorbar may be switched off between calls, drop stale colorbars
+        # (the images are kept, so each colorbar is still registered with its own)
+        if not self.show_colorbar:
+            for i, cb in enumerate(self._colorbars):
+                if cb is None:
+                    continue
+                try:
+                    cb.remove()
+                finally:
+                    self._colorbars[i] = None
 
         # Titles and data
         titles = [
@@ -122,18 +164,31 @@ class CustomValidatorPlotter(ValidatorPlotter):
         # Loop through subplots and apply limits (except for difference plots)
         for i, ax in enumerate(axes.flat):
             var = variables[i]  # Get variable type
-            if var != "None":  # Apply color limits only to true & predicted values
-                im = ax.imshow(data[i].T, origin="lower", extent=extent, cmap="jet", 
-                               vmin=colorbar_limits[var][0], vmax=colorbar_limits[var][1])
-            else:  # No fixed limits for difference plots
-                im = ax.imshow(data[i].T, origin="lower", extent=extent, cmap="jet")
-
-            ax.set_title(titles[i])
-            ax.set_xlabel("x")
-            ax.set_ylabel("y")
-            plt.colorbar(im, ax=ax)
-
-        plt.tight_layout()
+            im = self._images[i]
+            if im is None:  # First call: draw the image and label the axes
+                if var != "None":  # Apply color limits only to true & predicted values
+                    im = ax.imshow(data[i], origin="lower", extent=extent, cmap="jet", 
+                                   vmin=colorbar_limits[var][0], vmax=colorbar_limits[var][1])
+                else:  # No fixed limits for difference plots
+                    im = ax.imshow(data[i], origin="lower", extent=extent, cmap="jet")
+
+                ax.set_title(titles[i])
+                ax.set_xlabel("x")
+                ax.set_ylabel("y")
+                self._images[i] = im
+            else:  # Later calls only swap the data of the existing image
+                im.set_data(data[i])
+                im.set_extent(extent)
+                if var == "None":
+                    im.autoscale()
+
+            # Modulus and OpenFOAM plots of a row share fixed limits and one colorbar
+            if not self.show_colorbar or i % 3 == 0:
+                continue
+            # colorbars stay bound to their image and follow its norm
+            if self._colorbars[i] is None:
+                cb_ax = list(axes[i // 3, :2]) if var != "None" else ax
+                self._colorbars[i] = f.colorbar(im, ax=cb_ax)
 
         return [(f, "custom_plot")]
 
@@ -141,8 +196,6 @@ class CustomValidatorPlotter(ValidatorPlotter):
     @staticmethod
     def heat_sink_mask(xi, yi):
         """Returns a boolean mask where heat sink regions should be set to NaN"""
-        mask = np.zeros_like(xi, dtype=bool)  
-    
         heat_sink_x = -1  # Heat sink X position
         heat_sink_y_start = -0.3  # First fin Y position
         fin_thickness = 0.1
@@ -150,38 +203,148 @@ class CustomValidatorPlotter(ValidatorPlotter):
         gap = 0.15 + 0.1  # Fin spacing
         length = 1.0  # Heat sink length
     
-        for j in range(nr_fins):
-            fin_y = heat_sink_y_start + j * gap
-            mask |= ((xi >= heat_sink_x) & (xi <= heat_sink_x + length) &   
-                     (yi >= fin_y) & (yi <= fin_y + fin_thickness))
-    
-        return mask  
+        # Fin y origins broadcast against the grid, shape (nr_fins, 1, 1)
+        fin_ys = heat_sink_y_start + np.arange(nr_fins)[:, None, None] * gap
+        x_in = (xi >= heat_sink_x) & (xi <= heat_sink_x + length)
+        y_in = (yi[None] >= fin_ys) & (yi[None] <= fin_ys + fin_thickness)
+
+        return x_in & y_in.any(axis=0)
 
     @staticmethod
-    def interpolate_output(x, y, values, extent):
-        """Interpolates irregular points onto a mesh"""
+    @lru_cache(maxsize=4)
+    def _grid_and_mask(extent_key, grid_res):
+        """Returns the (read-only) (ny, nx) query mesh and heat sink mask for an extent"""
         xi, yi = np.meshgrid(
-            np.linspace(extent[0], extent[1], 100),
-            np.linspace(extent[2], extent[3], 100),
-            indexing="ij",
+            np.linspace(extent_key[0], extent_key[1], grid_res[0]),
+            np.linspace(extent_key[2], extent_key[3], grid_res[1]),
+            indexing="xy",
         )
-        
         mask = CustomValidatorPlotter.heat_sink_mask(xi, yi)
-        
-        interpolated_values = [
-            scipy.interpolate.griddata((x, y), value, (xi, yi), method='linear') for value in values
-        ]
-        
-        interpolated_values = [np.nan_to_num(val, nan=np.nan) for val in interpolated_values]
-        
-        for i in range(len(interpolated_values)):
-            interpolated_values[i][mask] = np.nan
+        for arr in (xi, yi, mask):
+            arr.flags.writeable = False
+
+        return xi, yi, mask
+
+    @staticmethod
+    def _bary_weights(tri, extent, grid_res):
+        """Locates the query grid in tri, returning (shape, weights, vertices, blank)"""
+        extent_key = tuple(round(float(e), 6) for e in extent)
+        xi, yi, mask = CustomValidatorPlotter._grid_and_mask(extent_key, tuple(grid_res))
+        query_pts = np.column_stack([xi.ravel(), yi.ravel()])
+
+        simplex = tri.find_simplex(query_pts)
+        transform = tri.transform[simplex]
+        bary = np.einsum("qij,qj->qi", transform[:, :2], query_pts - transform[:, 2])
+        weights = np.column_stack([bary, 1 - bary.sum(axis=1)])
+        # Blank points outside the convex hull and inside the heat sink
+        blank = (simplex == -1) | mask.ravel()
+
+        return xi.shape, weights, tri.simplices[simplex], blank
+
+    @staticmethod
+    def _bary_to_device(bary, device):
+        """Moves the weights and vertex indices of _bary_weights to a torch device"""
+        shape, weights, vertices, blank = bary
+        weights_t = torch.as_tensor(weights, dtype=torch.float32, device=device)
+        vertices_t = torch.as_tensor(vertices, device=device)
+
+        return shape, weights_t, vertices_t, blank
+
+    @staticmethod
+    def _bary_interp(weights, vertices, stacked):
+        """Evaluates stacked (N_points, N_fields) values at the query points"""
+        if isinstance(weights, np.ndarray):
+            return np.einsum("qs,qsf->qf", weights, stacked[vertices])
+
+        # Weights and vertices already live on the device, only the fields are copied
+        stacked_t = torch.as_tensor(stacked, dtype=weights.dtype, device=weights.device)
+        return torch.einsum("qs,qsf->qf", weights, stacked_t[vertices]).cpu().numpy()
+
+    @staticmethod
+    def interpolate_output(
+        x, y, values, extent, grid_res=GRID_RES, device=None, tri=None, bary=None
+    ):
+        """Interpolates irregular points onto a (nx, ny) mesh, optionally reusing
+        the triangulation tri or the query weights bary from _bary_weights"""
+        # Triangulate the point cloud once and share the barycentric weights
+        # of the query grid across all fields (same result as linear griddata)
+        if bary is None:
+            if tri is None:
+                tri = scipy.spatial.Delaunay(np.column_stack([x, y]))
+            bary = CustomValidatorPlotter._bary_weights(tri, extent, grid_res)
+            if device is not None:
+                bary = CustomValidatorPlotter._bary_to_device(bary, device)
+        shape, weights, vertices, blank = bary
+
+        # Interpolate all fields in a single pass over the stacked values
+        stacked = np.stack(values, axis=1)  # (N_points, N_fields)
+        out = CustomValidatorPlotter._bary_interp(weights, vertices, stacked)
+        out[blank] = np.nan
+
+        interpolated_values = [out[:, i].reshape(shape) for i in range(out.shape[1])]
 
         return interpolated_values
 
 
+def autocast_arch(arch, dtype=torch.bfloat16):
+    """Runs the network forward under CUDA autocast, returning float32 outputs
+
+    Derivatives taken through the wrapped forward (u_x, u_xx, ...) are still
+    computed through the bf16 matmuls and carry their reduced precision.
+    """
+    if not (
+        torch.cuda.is_available()
+        and torch.cuda.is_bf16_supported(including_emulation=False)
+    ):
+        return arch
+
+    forward = arch.forward
+
+    def autocast_forward(in_vars):
+        with torch.autocast(device_type="cuda", dtype=dtype):
+            out = forward(in_vars)
+        # cast back so downstream nodes see the same dtype as without autocast
+        return {key: value.float() for key, value in out.items()}
+
+    arch.forward = autocast_forward
+    return arch
+
+
+def export_onnx(arch, file_path):
+    """Exports a trained (x, y) network to ONNX, e.g. for a TensorRT engine"""
+
+    class PointsToOutputs(torch.nn.Module):
+        def __init__(self, arch):
+            super().__init__()
+            self.arch = arch
+
+        def forward(self, xy):
+            in_vars = {key.name: xy[:, i : i + 1] for i, key in enumerate(self.arch.input_keys)}
+            # bypass the autocast wrapper set on the instance
+            out = type(self.arch).forward(self.arch, in_vars)
+            return torch.cat([out[key.name] for key in self.arch.output_keys], dim=1)
+
+    dummy_xy = torch.zeros(
+        1024, len(arch.input_keys), device=next(arch.parameters()).device
+    )
+    torch.onnx.export(
+        PointsToOutputs(arch).eval(),
+        (dummy_xy,),
+        file_path,
+        opset_version=17,
+        input_names=["xy"],
+        output_names=["".join(key.name for key in arch.output_keys)],
+        dynamic_axes={"xy": {0: "N"}},
+    )
+
+
 @modulus.sym.main(config_path="conf", config_name="config")
 def run(cfg: ModulusConfig) -> None:
+    # allow TF32 tensor-core matmuls for the fully connected networks
+    torch.set_float32_matmul_precision("high")
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+
     # params for domain
     channel_length = (-2.5, 2.5)
     channel_width = (-0.5, 0.5)
@@ -255,6 +418,10 @@ def run(cfg: ModulusConfig) -> None:
         output_keys=[Key("c")],
         cfg=cfg.arch.fully_connected,
     )
+    # opt-in (+amp_bf16=true): bf16 forwards cost derivative accuracy in the residuals
+    if cfg.get("amp_bf16", False):
+        flow_net = autocast_arch(flow_net)
+        heat_net = autocast_arch(heat_net)
 
     nodes = (
         ns.make_nodes()
@@ -353,7 +520,8 @@ def run(cfg: ModulusConfig) -> None:
 
     # add validation data
     file_path = "openfoam/heat_sink_zeroEq_Pr5_mesh20.csv"
-    if os.path.exists(to_absolute_path(file_path)):
+    abs_file_path = to_absolute_path(file_path)
+    if os.path.exists(abs_file_path):
         mapping = {
             "Points:0": "x",
             "Points:1": "y",
@@ -364,26 +532,33 @@ def run(cfg: ModulusConfig) -> None:
             "nuT": "nu",
             "T": "c",
         }
-        openfoam_var = csv_to_dict(to_absolute_path(file_path), mapping)
+        openfoam_var = csv_to_dict(abs_file_path, mapping)
+        # networks train in float32, so store the validation data that way
+        openfoam_var = {
+            key: value.astype(np.float32, copy=False)
+            for key, value in openfoam_var.items()
+        }
         openfoam_var["nu"] += nu
-        openfoam_var["c"] += -base_temp
-        openfoam_var["c"] /= 273.15
+        np.subtract(openfoam_var["c"], base_temp, out=openfoam_var["c"])
+        openfoam_var["c"] *= 1.0 / 273.15
         openfoam_invar_numpy = {
-            key: value
-            for key, value in openfoam_var.items()
-            if key in ["x", "y", "sdf"]
+            key: openfoam_var[key] for key in ("x", "y", "sdf")
         }
         openfoam_outvar_numpy = {
-            key: value
-            for key, value in openfoam_var.items()
-            if key in ["u", "v", "nu" , "p", "c"]  # add "nu"
+            key: openfoam_var[key] for key in ("u", "v", "nu", "p", "c")  # add "nu"
         }
         openfoam_validator = PointwiseValidator(
             nodes=nodes,
             invar=openfoam_invar_numpy,
             true_outvar=openfoam_outvar_numpy,
-            plotter=CustomValidatorPlotter(), # add
-            batch_size=1024,# add
+            # +plot_device=cuda evaluates the plot interpolation on the GPU; the fields
+            # are still copied per call, so it only pays off for large grid_res
+            # +plot_colorbar=false skips colorbars on the validator plots
+            plotter=CustomValidatorPlotter(
+                device=cfg.get("plot_device", None),
+                show_colorbar=cfg.get("plot_colorbar", True),
+            ), # add
+            batch_size=cfg.batch_size.get("validator", 32768),# add
             requires_grad=True,# add
         )
         domain.add_validator(openfoam_validator)
@@ -435,6 +610,12 @@ def run(cfg: ModulusConfig) -> None:
     # start solver
     slv.solve()
 
+    # opt-in (+export_onnx=true): export trained networks for TensorRT inference,
+    # e.g. trtexec --onnx=flow_network.onnx --fp16
+    if cfg.get("export_onnx", False):
+        export_onnx(flow_net, os.path.join(cfg.network_dir, "flow_network.onnx"))
+        export_onnx(heat_net, os.path.join(cfg.network_dir, "heat_network.onnx"))
+
 
 if __name__ == "__main__":
     run()